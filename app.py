@@ -1,28 +1,97 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, render_template_string
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import cv2
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout
+from tensorflow.keras.layers import Conv2D, SeparableConv2D, MaxPooling2D, GlobalAveragePooling2D, Dense, Dropout
 import base64
-import json
+import orjson
+import logging
+import logging.handlers
 import sqlite3
 import threading
 import time
+import queue
+import atexit
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from datetime import datetime
 import os
-from werkzeug.utils import secure_filename
+import random
+import tempfile
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.http import generate_etag
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Run kernels as plain NumPy when numba is not installed"""
+        if args and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# Logging goes through a queue so request threads never block on stdout
+log_queue = queue.Queue(-1)
+logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+logging.getLogger().setLevel(logging.INFO)
+log_listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
+logger = logging.getLogger(__name__)
+
+class EmotionDetectorBusy(Exception):
+    """Raised when the inference queue is full or a result is not ready in time"""
+
+class OrjsonSocketIOJSON:
+    """json-module shim so python-socketio encodes packets with orjson"""
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return orjson.dumps(obj).decode()
+    
+    @staticmethod
+    def loads(s, *args, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'quantum_learning_secret_key_2024'
-socketio = SocketIO(app, cors_allowed_origins="*")
+app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # Cap uploaded frames at 2 MB
+socketio = SocketIO(app, cors_allowed_origins="*", json=OrjsonSocketIOJSON)
 CORS(app)
 
+def ojson(obj, status=200):
+    """JSON response encoded with orjson"""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    return ojson({'error': 'Request too large'}, 413)
+
 class EmotionDetector:
     def __init__(self):
         self.model = None
+        self.interpreter = None
+        self.input_details = None
+        self.output_details = None
+        self.max_batch_size = 32
+        self.inference_timeout = 0.2
+        self.max_queue_size = 256
+        self._interpreter_batch_size = 1
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        # Pool of (resized uint8, normalized float32) preprocessing buffers. A caller owns a
+        # buffer pair until it is queued; the worker returns it once the batch is copied out.
+        self._buffer_pool = queue.Queue(maxsize=self.max_queue_size + self.max_batch_size)
+        for _ in range(self.max_batch_size):
+            self._buffer_pool.put_nowait(self._new_buffers())
+        # cache_key -> (mean luminance of the 48x48 crop, emotions, monotonic time) for still-camera frames
+        self.still_frame_threshold = 0.5
+        self.max_cached_frame_age = 1.0  # seconds; expressions can change while luminance doesn't
+        self.max_cached_frames = 10000
+        self._frame_cache = OrderedDict()
+        self._frame_cache_lock = threading.Lock()
         self.emotion_labels = ['happy', 'sad', 'angry', 'surprised', 'fearful', 'disgusted', 'neutral']
         self.learning_emotions = {
             'happy': 'engaged',
@@ -34,58 +103,214 @@ class EmotionDetector:
             'disgusted': 'bored'
         }
         self.build_model()
+        self.warm_up()
+        
+        # Single worker batches queued faces into one inference call
+        self._worker = threading.Thread(target=self._inference_worker, daemon=True)
+        self._worker.start()
     
     def build_model(self):
         """Build a simple CNN for emotion detection"""
         try:
             # Try to load pre-trained model
             self.model = tf.keras.models.load_model('emotion_model.h5')
-            print("✅ Loaded pre-trained emotion model")
+            logger.info("✅ Loaded pre-trained emotion model")
         except:
             # Build and train a basic model
-            print("🔄 Building new emotion detection model...")
+            logger.info("🔄 Building new emotion detection model...")
             self.model = Sequential([
                 Conv2D(32, (3, 3), activation='relu', input_shape=(48, 48, 1)),
                 Conv2D(64, (3, 3), activation='relu'),
                 MaxPooling2D(2, 2),
-                Conv2D(128, (3, 3), activation='relu'),
-                Conv2D(128, (3, 3), activation='relu'),
+                SeparableConv2D(128, (3, 3), activation='relu'),
                 MaxPooling2D(2, 2),
-                Flatten(),
-                Dense(512, activation='relu'),
-                Dropout(0.5),
+                GlobalAveragePooling2D(),
+                Dropout(0.3),
                 Dense(len(self.emotion_labels), activation='softmax')
             ])
             self.model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-            print("✅ Basic emotion model built (needs training with real data)")
+            logger.info("✅ Basic emotion model built (needs training with real data)")
+        
+        self.build_interpreter()
+    
+    def build_interpreter(self):
+        """Convert the Keras model to a quantized TFLite interpreter for fast inference"""
+        # float16 by default; int8 (dynamic range) is opt-in since it can be slower on x86
+        quantization = os.environ.get('EMOTION_MODEL_QUANTIZATION', 'float16')
+        try:
+            converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if quantization != 'int8':
+                converter.target_spec.supported_types = [tf.float16]
+            tflite_model = converter.convert()
+            
+            # Load from memory so concurrent workers never read each other's half-written file
+            self.interpreter = tf.lite.Interpreter(model_content=tflite_model, num_threads=os.cpu_count())
+            self.interpreter.allocate_tensors()
+            self.input_details = self.interpreter.get_input_details()
+            self.output_details = self.interpreter.get_output_details()
+            logger.info("✅ TFLite emotion interpreter ready (%s)", quantization)
+        except Exception as e:
+            # Fall back to Keras inference
+            self.interpreter = None
+            logger.warning("⚠️ TFLite conversion failed, using Keras model: %s", e)
+            return
+        
+        self.save_tflite_model(tflite_model)
+    
+    def save_tflite_model(self, tflite_model, path='emotion_model.tflite'):
+        """Write the converted model as an optional artifact, atomically via temp file + rename"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tflite.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(tflite_model)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("⚠️ Could not save %s: %s", path, e)
+    
+    def warm_up(self):
+        """Run one dummy batch so the first real request doesn't pay Keras/TFLite startup cost"""
+        try:
+            self.predict_batch(np.zeros((1, 48, 48, 1), dtype=np.float32))
+        except Exception as e:
+            logger.warning("⚠️ Emotion model warm-up failed: %s", e)
+    
+    def submit(self, processed_face, buffers=None):
+        """Queue a preprocessed face for batched inference and return a Future of its scores"""
+        future = Future()
+        try:
+            self._queue.put_nowait((processed_face, future, buffers))
+        except queue.Full:
+            raise EmotionDetectorBusy('inference queue is full')
+        return future
     
-    def preprocess_face(self, face_image):
+    def _inference_worker(self):
+        """Drain up to max_batch_size queued faces and run them as one batch"""
+        while True:
+            items = [self._queue.get()]
+            try:
+                while len(items) < self.max_batch_size:
+                    items.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            
+            # Skip faces whose caller already gave up and cancelled
+            live = [item for item in items if item[1].set_running_or_notify_cancel()]
+            
+            try:
+                if live:
+                    batch = np.concatenate([tensor for tensor, _, _ in live])
+            finally:
+                # The batch holds its own copy, so the buffers can go back to the pool
+                for _, _, buffers in items:
+                    self._release_buffers(buffers)
+            if not live:
+                continue
+            
+            try:
+                scores = self.predict_batch(batch)
+                for i, (_, future, _) in enumerate(live):
+                    future.set_result(scores[i])
+            except Exception as e:
+                for _, future, _ in live:
+                    future.set_exception(e)
+    
+    def predict_batch(self, batch):
+        """Run the emotion model on a (N, 48, 48, 1) batch"""
+        if self.interpreter is None:
+            return self.model.predict(batch, verbose=0)
+        
+        input_index = self.input_details[0]['index']
+        if len(batch) != self._interpreter_batch_size:
+            # The converted model keeps a dynamic batch dimension
+            self.interpreter.resize_tensor_input(input_index, batch.shape)
+            self.interpreter.allocate_tensors()
+            self._interpreter_batch_size = len(batch)
+        
+        self.interpreter.set_tensor(input_index, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_details[0]['index'])
+    
+    def _new_buffers(self):
+        return np.empty((48, 48), dtype=np.uint8), np.empty((1, 48, 48, 1), dtype=np.float32)
+    
+    def _acquire_buffers(self):
+        """Take a (resized uint8, normalized float32) buffer pair, allocating if the pool is empty"""
+        try:
+            return self._buffer_pool.get_nowait()
+        except queue.Empty:
+            return self._new_buffers()
+    
+    def _release_buffers(self, buffers):
+        if buffers is None:
+            return
+        try:
+            self._buffer_pool.put_nowait(buffers)
+        except queue.Full:
+            pass
+    
+    def preprocess_face(self, face_image, buffers=None):
         """Preprocess face image for emotion detection"""
         if face_image is None:
             return None
+        if buffers is None:
+            buffers = self._new_buffers()
         
         # Convert to grayscale if needed
-        if len(face_image.shape) == 3:
+        if face_image.ndim == 3:
             face_image = cv2.cvtColor(face_image, cv2.COLOR_BGR2GRAY)
         
-        # Resize to model input size
-        face_image = cv2.resize(face_image, (48, 48))
-        face_image = face_image.astype('float32') / 255.0
-        face_image = np.expand_dims(face_image, axis=0)
-        face_image = np.expand_dims(face_image, axis=3)
+        # Resize to model input size and scale to [0, 1] without intermediate arrays
+        resized, input_buf = buffers
+        cv2.resize(face_image, (48, 48), dst=resized, interpolation=cv2.INTER_AREA)
+        np.multiply(resized, np.float32(1 / 255.0), out=input_buf[0, :, :, 0])
         
-        return face_image
+        return input_buf
+    
+    def _cached_frame_result(self, cache_key, mean):
+        """Return the caller's last emotions if its frame luminance barely changed recently"""
+        with self._frame_cache_lock:
+            cached = self._frame_cache.get(cache_key)
+            if cached is None:
+                return None
+            cached_mean, emotions, cached_at = cached
+            if abs(mean - cached_mean) >= self.still_frame_threshold:
+                return None
+            if time.monotonic() - cached_at >= self.max_cached_frame_age:
+                return None
+            self._frame_cache.move_to_end(cache_key)
+            return emotions
     
-    def detect_emotions(self, face_image):
-        """Detect emotions from face image"""
+    def _remember_frame_result(self, cache_key, mean, emotions):
+        with self._frame_cache_lock:
+            self._frame_cache[cache_key] = (mean, emotions, time.monotonic())
+            self._frame_cache.move_to_end(cache_key)
+            if len(self._frame_cache) > self.max_cached_frames:
+                self._frame_cache.popitem(last=False)
+    
+    def detect_emotions(self, face_image, cache_key=None):
+        """Detect emotions from face image; cache_key lets a still camera reuse its last result"""
+        # Owned until submit() hands the buffers to the worker; released in finally otherwise
+        buffers = self._acquire_buffers()
         try:
-            processed_face = self.preprocess_face(face_image)
+            processed_face = self.preprocess_face(face_image, buffers)
             if processed_face is None:
                 return self.get_neutral_emotions()
             
-            # Get emotion predictions
-            predictions = self.model.predict(processed_face, verbose=0)
-            emotion_scores = predictions[0]
+            if cache_key is not None:
+                mean = cv2.mean(buffers[0])[0]
+                cached = self._cached_frame_result(cache_key, mean)
+                if cached is not None:
+                    return cached
+            
+            # Get emotion predictions from the batching worker, which now owns the buffers
+            future = self.submit(processed_face, buffers)
+            buffers = None
+            try:
+                emotion_scores = future.result(timeout=self.inference_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise EmotionDetectorBusy('inference timed out')
             
             # Convert to learning-relevant emotions
             learning_emotions = {
@@ -96,11 +321,19 @@ class EmotionDetector:
                 'bored': float(emotion_scores[5])  # disgusted
             }
             
+            if cache_key is not None:
+                self._remember_frame_result(cache_key, mean, learning_emotions)
+            
             return learning_emotions
             
-        except Exception as e:
-            print(f"❌ Emotion detection error: {e}")
+        except EmotionDetectorBusy as e:
+            logger.warning("⚠️ Emotion detector busy: %s", e)
+            raise
+        except Exception:
+            logger.exception("❌ Emotion detection error")
             return self.get_neutral_emotions()
+        finally:
+            self._release_buffers(buffers)
     
     def get_neutral_emotions(self):
         """Return neutral emotion state"""
@@ -112,66 +345,84 @@ class EmotionDetector:
             'bored': 0.1
         }
 
+LEARNING_STYLES = ('visual', 'auditory', 'kinesthetic')
+INTERACTION_STYLE_INDEX = {
+    'image_click': 0,
+    'visual_content': 0,
+    'audio_played': 1,
+    'voice_response': 1,
+    'interactive_activity': 2,
+    'hands_on': 2
+}
+
+@njit(cache=True)
+def _update_style_probabilities(probabilities, style_index, success_rate):
+    """Boost one style, renormalize in place and return the max probability"""
+    if style_index >= 0:
+        probabilities[style_index] *= 1 + success_rate * 0.3
+    probabilities /= probabilities.sum()
+    return probabilities.max()
+
+# Compile the kernel at import so the first update doesn't stall a worker inside the per-student lock
+_update_style_probabilities(np.array([0.33, 0.33, 0.34], dtype=np.float64), -1, 0.0)
+
 class QuantumLearningSystem:
     def __init__(self):
-        self.learning_styles = {
-            'visual': 0.33,
-            'auditory': 0.33,
-            'kinesthetic': 0.34
-        }
+        # Probabilities ordered as LEARNING_STYLES
+        self._probabilities = np.array([0.33, 0.33, 0.34], dtype=np.float64)
+        self.lock = threading.RLock()
         self.collapsed = False
         self.optimal_style = None
         self.confidence = 0.0
         self.interactions = []
     
+    @property
+    def learning_styles(self):
+        """Learning style probabilities as a style -> probability dict"""
+        return dict(zip(LEARNING_STYLES, self._probabilities.tolist()))
+    
     def update_quantum_state(self, interaction_data):
         """Update learning style probabilities based on interaction"""
         interaction_type = interaction_data.get('type', 'unknown')
         success_rate = interaction_data.get('success', 0.5)
         engagement = interaction_data.get('engagement', 0.5)
         
-        # Update probabilities based on interaction success
-        if interaction_type in ['image_click', 'visual_content']:
-            self.learning_styles['visual'] *= (1 + success_rate * 0.3)
-        elif interaction_type in ['audio_played', 'voice_response']:
-            self.learning_styles['auditory'] *= (1 + success_rate * 0.3)
-        elif interaction_type in ['interactive_activity', 'hands_on']:
-            self.learning_styles['kinesthetic'] *= (1 + success_rate * 0.3)
-        
-        # Normalize probabilities
-        total = sum(self.learning_styles.values())
-        for style in self.learning_styles:
-            self.learning_styles[style] /= total
-        
-        # Check for quantum collapse
-        max_prob = max(self.learning_styles.values())
-        if max_prob > 0.65 and not self.collapsed:
-            self.trigger_collapse()
-        
-        return self.learning_styles
+        # Update probabilities based on interaction success and normalize
+        style_index = INTERACTION_STYLE_INDEX.get(interaction_type, -1)
+        with self.lock:
+            max_prob = _update_style_probabilities(self._probabilities, style_index, float(success_rate))
+            
+            # Check for quantum collapse
+            if max_prob > 0.65 and not self.collapsed:
+                self.trigger_collapse()
+            
+            return self.learning_styles
     
     def trigger_collapse(self):
         """Trigger quantum collapse when optimal style is determined"""
-        self.collapsed = True
-        self.optimal_style = max(self.learning_styles.items(), key=lambda x: x[1])[0]
-        self.confidence = self.learning_styles[self.optimal_style]
-        
-        print(f"🌟 QUANTUM COLLAPSE! Optimal style: {self.optimal_style} ({self.confidence:.2%} confidence)")
-        return {
-            'collapsed': True,
-            'optimal_style': self.optimal_style,
-            'confidence': self.confidence,
-            'learning_styles': self.learning_styles
-        }
+        with self.lock:
+            self.collapsed = True
+            best = int(self._probabilities.argmax())
+            self.optimal_style = LEARNING_STYLES[best]
+            self.confidence = float(self._probabilities[best])
+            
+            logger.info("🌟 QUANTUM COLLAPSE! Optimal style: %s (%.2f%% confidence)", self.optimal_style, self.confidence * 100)
+            return {
+                'collapsed': True,
+                'optimal_style': self.optimal_style,
+                'confidence': self.confidence,
+                'learning_styles': self.learning_styles
+            }
     
     def get_state(self):
         """Get current quantum learning state"""
-        return {
-            'learning_styles': self.learning_styles,
-            'collapsed': self.collapsed,
-            'optimal_style': self.optimal_style,
-            'confidence': self.confidence
-        }
+        with self.lock:
+            return {
+                'learning_styles': self.learning_styles,
+                'collapsed': self.collapsed,
+                'optimal_style': self.optimal_style,
+                'confidence': self.confidence
+            }
 
 class AdaptiveContentGenerator:
     def __init__(self):
@@ -193,45 +444,55 @@ class AdaptiveContentGenerator:
             'cell_division': "ਸੈੱਲ ਵੰਡਦੇ ਹਨ ਜਿਵੇਂ ਗਿੱਦੜ ਦੇ ਬੱਚੇ ਦੋ ਹੋ ਜਾਂਦੇ ਹਨ",
             'water_cycle': "ਪਾਣੀ ਚੱਕਰ ਜਿਵੇਂ ਸਾਡੀ ਟਿਊਬਵੈੱਲ ਤੋਂ ਖੇਤਾਂ ਵਿੱਚ ਜਾਂਦਾ ਹੈ"
         }
-    
-    def generate_adaptations(self, emotions, learning_state, quantum_state):
-        """Generate AI adaptations based on current state"""
-        adaptations = []
         
-        # Emotion-based adaptations
-        if emotions.get('frustrated', 0) > 0.6:
-            adaptations.extend([
+        self._phrase_buckets = {category: tuple(phrases) for category, phrases in self.punjabi_phrases.items()}
+        
+        # (emotion, threshold, adaptations); callables are only evaluated when the rule fires
+        self._emotion_rules = (
+            ('frustrated', 0.6, (
                 "🎵 Switching to calmer, slower voice tone",
-                f"😌 Providing encouragement: '{self.get_random_phrase('encouragement')}'",
+                self._encouragement_adaptation,
                 "⏰ Suggesting 2-minute mindful break"
-            ])
-        
-        if emotions.get('bored', 0) > 0.6:
-            adaptations.extend([
+            )),
+            ('bored', 0.6, (
                 "⚡ Increasing energy and adding gamification",
                 "🎮 Launching interactive village farming simulation",
                 "🏆 Adding achievement badges and leaderboard"
-            ])
-        
-        if emotions.get('confused', 0) > 0.7:
-            adaptations.extend([
+            )),
+            ('confused', 0.7, (
                 "🔄 Simplifying explanation with rural Punjab analogies",
-                f"🗣️ Switching to step-by-step Punjabi explanation",
+                "🗣️ Switching to step-by-step Punjabi explanation",
                 "📱 Sending concept to phone for offline review"
-            ])
-        
-        if emotions.get('engaged', 0) > 0.8:
-            adaptations.extend([
+            )),
+            ('engaged', 0.8, (
                 "🚀 Increasing difficulty - student ready for advanced concepts",
                 "🎯 Preparing university-level content",
                 "👨‍🎓 Connecting with mentorship program"
-            ])
+            ))
+        )
+        
+        self._learning_state_adaptations = {
+            'struggling': "📚 Providing peer learning connection with successful rural student",
+            'disengaged': "🌟 Sharing local success story: 'Meet Simran from nearby village...'"
+        }
+    
+    def _encouragement_adaptation(self):
+        """Encouragement adaptation with a freshly chosen Punjabi phrase"""
+        return f"😌 Providing encouragement: '{self.get_random_phrase('encouragement')}'"
+    
+    def generate_adaptations(self, emotions, learning_state, quantum_state):
+        """Generate AI adaptations based on current state"""
+        adaptations = []
+        
+        # Emotion-based adaptations
+        for emotion, threshold, messages in self._emotion_rules:
+            if emotions.get(emotion, 0) > threshold:
+                adaptations.extend(m() if callable(m) else m for m in messages)
         
         # Learning state adaptations
-        if learning_state == 'struggling':
-            adaptations.append("📚 Providing peer learning connection with successful rural student")
-        elif learning_state == 'disengaged':
-            adaptations.append("🌟 Sharing local success story: 'Meet Simran from nearby village...'")
+        learning_adaptation = self._learning_state_adaptations.get(learning_state)
+        if learning_adaptation is not None:
+            adaptations.append(learning_adaptation)
         
         # Quantum state adaptations
         if quantum_state.get('collapsed'):
@@ -246,18 +507,83 @@ class AdaptiveContentGenerator:
     
     def get_random_phrase(self, category):
         """Get random phrase from category"""
-        import random
-        return random.choice(self.punjabi_phrases.get(category, ['Hello!']))
+        return random.choice(self._phrase_buckets.get(category, ('Hello!',)))
+
+# Face detection
+def detect_faces(gray):
+    """Return detected faces as (x, y, w, h) boxes"""
+    return FACE_CASCADE.detectMultiScale(gray, 1.2, 4, minSize=(60, 60))
 
 # Initialize global components
+FACE_CASCADE = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
 emotion_detector = EmotionDetector()
-quantum_system = QuantumLearningSystem()
 content_generator = AdaptiveContentGenerator()
 
+# Quantum learning state per student, evicting the least recently used
+QUANTUM_STATES = OrderedDict()
+QUANTUM_LOCK = threading.RLock()
+MAX_QUANTUM_STATES = 10000
+
+def get_quantum_system(student_id):
+    """Return the student's QuantumLearningSystem, creating it on first use"""
+    with QUANTUM_LOCK:
+        quantum_system = QUANTUM_STATES.get(student_id)
+        if quantum_system is None:
+            quantum_system = QUANTUM_STATES[student_id] = QuantumLearningSystem()
+            if len(QUANTUM_STATES) > MAX_QUANTUM_STATES:
+                QUANTUM_STATES.popitem(last=False)
+        else:
+            QUANTUM_STATES.move_to_end(student_id)
+        return quantum_system
+
+def peek_quantum_state(student_id):
+    """Return the student's quantum state without creating an entry or touching the LRU order"""
+    with QUANTUM_LOCK:
+        quantum_system = QUANTUM_STATES.get(student_id)
+    if quantum_system is None:
+        return QuantumLearningSystem().get_state()
+    return quantum_system.get_state()
+
 # Database setup
+DB_PATH = 'learning_data.db'
+DB_POOL_SIZE = 4
+DB_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+INTERACTION_QUEUE = queue.Queue(maxsize=10000)
+INTERACTION_WRITER_STOP = object()
+INTERACTION_WRITER_RETRY = 5  # seconds between attempts to open the database
+INTERACTION_FLUSH_SIZE = 50
+INTERACTION_FLUSH_INTERVAL = 1.0  # seconds
+INSERT_INTERACTION_SQL = '''
+    INSERT INTO interactions 
+    (student_id, timestamp, interaction_type, success_rate, engagement_level, emotions, adaptations_triggered)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+def connect_db():
+    """Open an autocommit SQLite connection in WAL mode"""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+@contextmanager
+def db():
+    """Borrow a connection from the shared pool, opening one if none is idle"""
+    try:
+        conn = DB_POOL.get_nowait()
+    except queue.Empty:
+        conn = connect_db()
+    try:
+        yield conn
+    finally:
+        try:
+            DB_POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 def init_database():
     """Initialize SQLite database for storing learning data"""
-    conn = sqlite3.connect('learning_data.db')
+    conn = connect_db()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -287,19 +613,20 @@ def init_database():
         )
     ''')
     
-    conn.commit()
+    # Per-student history lookups and the background hourly window
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_interactions_student_time
+        ON interactions (student_id, timestamp DESC)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_interactions_timestamp
+        ON interactions (timestamp)
+    ''')
+    
     conn.close()
-    print("✅ Database initialized")
+    logger.info("✅ Database initialized")
 
-# API Routes
-@app.route('/')
-def index():
-    """Serve the main HTML interface"""
-    try:
-        with open('quantum_learning_platform.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
-        return """
+FALLBACK_HTML = """
         <h1>Quantum Learning Platform Backend Running!</h1>
         <p>Place your HTML file as 'quantum_learning_platform.html' in the same directory.</p>
         <p>Backend is running on this port with the following endpoints:</p>
@@ -311,46 +638,73 @@ def index():
         </ul>
         """
 
+def load_index_html():
+    """Read the main HTML interface once at startup"""
+    try:
+        with open('quantum_learning_platform.html', 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return FALLBACK_HTML.encode('utf-8')
+
+INDEX_HTML = load_index_html()
+INDEX_ETAG = generate_etag(INDEX_HTML)
+
+# API Routes
+@app.route('/')
+def index():
+    """Serve the main HTML interface"""
+    response = app.response_class(
+        INDEX_HTML,
+        mimetype='text/html',
+        headers={'Cache-Control': 'public, max-age=300'}
+    )
+    # ETag lets repeat visits revalidate with a 304
+    response.set_etag(INDEX_ETAG)
+    return response.make_conditional(request)
+
 @app.route('/api/detect-emotion', methods=['POST'])
 def detect_emotion_endpoint():
     """Detect emotions from uploaded image"""
     try:
         if 'image' not in request.files:
-            return jsonify({'error': 'No image provided'}), 400
+            return ojson({'error': 'No image provided'}, 400)
         
         image_file = request.files['image']
         
-        # Read and decode image
-        image_data = image_file.read()
-        nparr = np.frombuffer(image_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # frombuffer wraps the uploaded bytes without a further copy
+        nparr = np.frombuffer(image_file.stream.read(), np.uint8)
+        # Haar detection only needs luminance, so let libjpeg skip chroma entirely
+        gray = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
         
-        if image is None:
-            return jsonify({'error': 'Invalid image format'}), 400
+        if gray is None:
+            return ojson({'error': 'Invalid image format'}, 400)
         
-        # Detect face (simplified - in production use proper face detection)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        faces = face_cascade.detectMultiScale(gray, 1.1, 4)
+        faces = detect_faces(gray)
         
         if len(faces) > 0:
             x, y, w, h = faces[0]
             face_roi = gray[y:y+h, x:x+w]
-            emotions = emotion_detector.detect_emotions(face_roi)
+            emotions = emotion_detector.detect_emotions(face_roi, cache_key=request.form.get('student_id'))
         else:
             # No face detected, return neutral emotions
             emotions = emotion_detector.get_neutral_emotions()
         
-        return jsonify({
+        return ojson({
             'success': True,
             'emotions': emotions,
             'face_detected': len(faces) > 0,
             'timestamp': datetime.now().isoformat()
         })
     
+    except EmotionDetectorBusy:
+        return ojson({'error': 'Emotion detector busy, try again'}, 503)
+    
+    except HTTPException:
+        raise  # Let the app's error handlers answer (e.g. 413 from MAX_CONTENT_LENGTH)
+    
     except Exception as e:
-        print(f"❌ Error in emotion detection: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.exception("❌ Error in emotion detection")
+        return ojson({'error': str(e)}, 500)
 
 @app.route('/api/quantum-update', methods=['POST'])
 def quantum_update_endpoint():
@@ -363,26 +717,32 @@ def quantum_update_endpoint():
             'engagement': data.get('engagement_level', 0.5)
         }
         
+        student_id = data.get('student_id', 'anonymous')
+        quantum_system = get_quantum_system(student_id)
+        
         # Update quantum state
         new_state = quantum_system.update_quantum_state(interaction_data)
         
         # Store interaction in database
         store_interaction(
-            student_id=data.get('student_id', 'anonymous'),
+            student_id=student_id,
             interaction_data=interaction_data,
             emotions=data.get('emotions', {}),
             adaptations=data.get('adaptations_triggered', [])
         )
         
-        return jsonify({
+        return ojson({
             'success': True,
             'quantum_state': quantum_system.get_state(),
             'timestamp': datetime.now().isoformat()
         })
     
+    except HTTPException:
+        raise
+    
     except Exception as e:
-        print(f"❌ Error in quantum update: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.exception("❌ Error in quantum update")
+        return ojson({'error': str(e)}, 500)
 
 @app.route('/api/get-adaptations', methods=['POST'])
 def get_adaptations_endpoint():
@@ -391,83 +751,86 @@ def get_adaptations_endpoint():
         data = request.get_json()
         emotions = data.get('emotions', {})
         learning_state = data.get('learning_state', 'neutral')
-        quantum_state = quantum_system.get_state()
+        quantum_state = get_quantum_system(data.get('student_id', 'anonymous')).get_state()
         
         # Generate adaptations
         adaptations = content_generator.generate_adaptations(
             emotions, learning_state, quantum_state
         )
         
-        return jsonify({
+        return ojson({
             'success': True,
             'adaptations': adaptations,
             'quantum_state': quantum_state,
             'timestamp': datetime.now().isoformat()
         })
     
+    except HTTPException:
+        raise
+    
     except Exception as e:
-        print(f"❌ Error generating adaptations: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.exception("❌ Error generating adaptations")
+        return ojson({'error': str(e)}, 500)
 
 @app.route('/api/student-analytics/<student_id>')
 def student_analytics_endpoint(student_id):
     """Get analytics for a specific student"""
     try:
-        conn = sqlite3.connect('learning_data.db')
-        cursor = conn.cursor()
-        
-        # Get recent interactions
-        cursor.execute('''
-            SELECT * FROM interactions 
-            WHERE student_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 50
-        ''', (student_id,))
-        
-        interactions = cursor.fetchall()
-        
-        # Calculate analytics
-        if interactions:
-            success_rates = [row[4] for row in interactions if row[4] is not None]
-            engagement_levels = [row[5] for row in interactions if row[5] is not None]
+        with db() as conn:
+            cursor = conn.cursor()
             
-            analytics = {
-                'total_interactions': len(interactions),
-                'avg_success_rate': sum(success_rates) / len(success_rates) if success_rates else 0,
-                'avg_engagement': sum(engagement_levels) / len(engagement_levels) if engagement_levels else 0,
-                'quantum_state': quantum_system.get_state(),
-                'recent_interactions': interactions[:10]  # Last 10 interactions
-            }
-        else:
-            analytics = {
-                'total_interactions': 0,
-                'avg_success_rate': 0,
-                'avg_engagement': 0,
-                'quantum_state': quantum_system.get_state(),
-                'recent_interactions': []
-            }
+            # Aggregate the last 50 interactions in SQL (AVG skips NULLs)
+            cursor.execute('''
+                SELECT COUNT(*), AVG(success_rate), AVG(engagement_level)
+                FROM (
+                    SELECT success_rate, engagement_level FROM interactions 
+                    WHERE student_id = ? 
+                    ORDER BY timestamp DESC 
+                    LIMIT 50
+                )
+            ''', (student_id,))
+            
+            total_interactions, avg_success_rate, avg_engagement = cursor.fetchone()
+            
+            # Only the last 10 rows are returned to the client
+            cursor.execute('''
+                SELECT * FROM interactions 
+                WHERE student_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT 10
+            ''', (student_id,))
+            recent_interactions = cursor.fetchall()
         
-        conn.close()
+        analytics = {
+            'total_interactions': total_interactions,
+            'avg_success_rate': avg_success_rate or 0,
+            'avg_engagement': avg_engagement or 0,
+            'quantum_state': peek_quantum_state(student_id),
+            'recent_interactions': recent_interactions
+        }
         
-        return jsonify({
+        return ojson({
             'success': True,
             'analytics': analytics,
             'timestamp': datetime.now().isoformat()
         })
     
+    except HTTPException:
+        raise
+    
     except Exception as e:
-        print(f"❌ Error getting analytics: {e}")
-        return jsonify({'error': str(e)}), 500
+        logger.exception("❌ Error getting analytics")
+        return ojson({'error': str(e)}, 500)
 
 # WebSocket events for real-time communication
 @socketio.on('connect')
 def handle_connect():
-    print('🔌 Client connected')
+    logger.debug('🔌 Client connected')
     emit('connected', {'message': 'Connected to Quantum Learning Platform'})
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print('🔌 Client disconnected')
+    logger.debug('🔌 Client disconnected')
 
 @socketio.on('emotion_update')
 def handle_emotion_update(data):
@@ -478,61 +841,134 @@ def handle_emotion_update(data):
         learning_state = data.get('learning_state', 'neutral')
         
         adaptations = content_generator.generate_adaptations(
-            emotions, learning_state, quantum_system.get_state()
+            emotions, learning_state, get_quantum_system(data.get('student_id', 'anonymous')).get_state()
         )
         
-        # Broadcast adaptations to all connected clients
+        # Adaptations are per student, so only the sender receives them
         emit('adaptations_generated', {
             'adaptations': adaptations,
             'timestamp': datetime.now().isoformat()
-        }, broadcast=True)
+        })
         
     except Exception as e:
-        print(f"❌ Error in emotion update: {e}")
+        logger.exception("❌ Error in emotion update")
         emit('error', {'message': str(e)})
 
 @socketio.on('quantum_collapse')
 def handle_quantum_collapse(data):
     """Handle quantum collapse events"""
     try:
-        collapse_data = quantum_system.trigger_collapse()
+        student_id = (data or {}).get('student_id', 'anonymous')
+        collapse_data = get_quantum_system(student_id).trigger_collapse()
         
-        # Broadcast collapse event
+        # Send the collapse event back to the student it belongs to
         emit('quantum_collapsed', {
             'collapse_data': collapse_data,
             'timestamp': datetime.now().isoformat()
-        }, broadcast=True)
+        })
         
     except Exception as e:
-        print(f"❌ Error in quantum collapse: {e}")
+        logger.exception("❌ Error in quantum collapse")
         emit('error', {'message': str(e)})
 
 # Helper functions
 def store_interaction(student_id, interaction_data, emotions, adaptations):
-    """Store interaction data in database"""
+    """Queue interaction data for the batched database writer"""
     try:
-        conn = sqlite3.connect('learning_data.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO interactions 
-            (student_id, timestamp, interaction_type, success_rate, engagement_level, emotions, adaptations_triggered)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        ensure_interaction_writer()
+        INTERACTION_QUEUE.put_nowait((
             student_id,
             datetime.now(),
             interaction_data.get('type'),
             interaction_data.get('success'),
             interaction_data.get('engagement'),
-            json.dumps(emotions),
-            json.dumps(adaptations)
+            orjson.dumps(emotions).decode(),
+            orjson.dumps(adaptations).decode()
         ))
         
-        conn.commit()
-        conn.close()
+    except queue.Full:
+        logger.warning("⚠️ Interaction queue full, dropping interaction for %s", student_id)
+    except Exception:
+        logger.exception("❌ Error storing interaction")
+
+def write_interactions(conn, rows):
+    """Insert a batch of interaction rows in one transaction"""
+    try:
+        conn.execute('BEGIN')
+        conn.executemany(INSERT_INTERACTION_SQL, rows)
+        conn.execute('COMMIT')
+    except Exception:
+        logger.exception("❌ Error writing %d interactions", len(rows))
+        try:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+        except sqlite3.Error:
+            pass
+
+def interaction_writer():
+    """Flush queued interactions with executemany every N rows or interval, whichever comes first"""
+    while True:
+        try:
+            conn = connect_db()
+            break
+        except Exception:
+            logger.exception("❌ Interaction writer cannot open the database, retrying in %ds", INTERACTION_WRITER_RETRY)
+            time.sleep(INTERACTION_WRITER_RETRY)
+    
+    stopping = False
+    while not stopping:
+        item = INTERACTION_QUEUE.get()
+        if item is INTERACTION_WRITER_STOP:
+            break
+        rows = [item]
+        deadline = time.monotonic() + INTERACTION_FLUSH_INTERVAL
+        while len(rows) < INTERACTION_FLUSH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = INTERACTION_QUEUE.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is INTERACTION_WRITER_STOP:
+                stopping = True
+                break
+            rows.append(item)
         
-    except Exception as e:
-        print(f"❌ Error storing interaction: {e}")
+        write_interactions(conn, rows)
+    conn.close()
+
+_interaction_writer_thread = None
+_interaction_writer_lock = threading.Lock()
+
+def ensure_interaction_writer():
+    """Start the writer on first use, and restart it if it has died"""
+    global _interaction_writer_thread
+    writer = _interaction_writer_thread
+    if writer is not None and writer.is_alive():
+        return
+    with _interaction_writer_lock:
+        writer = _interaction_writer_thread
+        if writer is not None and writer.is_alive():
+            return
+        if writer is None:
+            atexit.register(stop_interaction_writer)
+        else:
+            logger.error("❌ Interaction writer stopped unexpectedly, restarting it")
+        _interaction_writer_thread = threading.Thread(target=interaction_writer, daemon=True)
+        _interaction_writer_thread.start()
+
+def stop_interaction_writer():
+    """Flush interactions still queued when the process exits"""
+    writer = _interaction_writer_thread
+    if writer is None or not writer.is_alive():
+        return
+    try:
+        INTERACTION_QUEUE.put(INTERACTION_WRITER_STOP, timeout=5)
+    except queue.Full:
+        logger.warning("⚠️ Interaction queue full at shutdown, some interactions were not saved")
+        return
+    writer.join(timeout=5)
 
 # Background tasks
 def background_analytics_processor():
@@ -540,52 +976,57 @@ def background_analytics_processor():
     while True:
         try:
             # Process analytics, generate insights, etc.
-            time.sleep(30)  # Run every 30 seconds
+            socketio.sleep(30)  # Run every 30 seconds
             
             # Example: Check for students who might need intervention
-            conn = sqlite3.connect('learning_data.db')
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT student_id, AVG(success_rate), AVG(engagement_level)
-                FROM interactions 
-                WHERE timestamp > datetime('now', '-1 hour')
-                GROUP BY student_id
-                HAVING AVG(success_rate) < 0.3 OR AVG(engagement_level) < 0.3
-            ''')
-            
-            struggling_students = cursor.fetchall()
+            with db() as conn:
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    SELECT student_id, AVG(success_rate), AVG(engagement_level)
+                    FROM interactions 
+                    WHERE timestamp > datetime('now', '-1 hour')
+                    GROUP BY student_id
+                    HAVING AVG(success_rate) < 0.3 OR AVG(engagement_level) < 0.3
+                ''')
+                
+                struggling_students = cursor.fetchall()
+            socketio.sleep(0)  # Let other greenlets run after the synchronous query
             
             if struggling_students:
-                print(f"⚠️ {len(struggling_students)} students may need intervention")
+                logger.warning("⚠️ %d students may need intervention", len(struggling_students))
                 # Here you could trigger alerts, notifications, etc.
             
-            conn.close()
-            
-        except Exception as e:
-            print(f"❌ Error in background analytics: {e}")
-            time.sleep(60)  # Wait longer if there's an error
+        except Exception:
+            logger.exception("❌ Error in background analytics")
+            socketio.sleep(60)  # Wait longer if there's an error
 
-if __name__ == '__main__':
-    print("🚀 Starting Quantum Learning Platform Backend...")
+_services_started = False
+
+def start_services():
+    """Initialize the database and start background workers (once per process)"""
+    global _services_started
+    if _services_started:
+        return
+    _services_started = True
     
     # Initialize database
     init_database()
     
     # Start background tasks
-    analytics_thread = threading.Thread(target=background_analytics_processor, daemon=True)
-    analytics_thread.start()
+    socketio.start_background_task(background_analytics_processor)
     
-    print("✅ Backend initialization complete!")
-    print("📡 Server starting on http://localhost:5000")
-    print("🔌 WebSocket server ready for real-time communication")
-    print("📊 Analytics processor running in background")
+    logger.info("✅ Backend initialization complete!")
+    logger.info("🔌 WebSocket server ready for real-time communication")
+    logger.info("📊 Analytics processor running in background")
+
+if __name__ == '__main__':
+    # Local development server; production runs gunicorn against wsgi.py (see Procfile)
+    logger.info("🚀 Starting Quantum Learning Platform Backend...")
+    start_services()
     
-    # Run the Flask-SocketIO app
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True)
+    port = int(os.environ.get('PORT', 5000))  # Render gives you the PORT
+    logger.info("📡 Server starting on http://localhost:%d", port)
     
-    import os
-
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))  # Render gives you the PORT
-    app.run(host="0.0.0.0", port=port)
+    # Run the Flask-SocketIO app
+    socketio.run(app, host='0.0.0.0', port=port, debug=os.environ.get('FLASK_ENV') == 'development')
@@ -51,6 +51,7 @@ class QuantumLearningConnector {
         canvas.toBlob(async (blob) => {
             const formData = new FormData();
             formData.append('image', blob, 'frame.jpg');
+            formData.append('student_id', this.studentId);
 
             try {
                 const response = await fetch(`${this.apiBase}/detect-emotion`, {
@@ -130,6 +130,7 @@ class QuantumLearningConnector {
         try {
             const formData = new FormData();
             formData.append('image', imageBlob, 'frame.jpg');
+            formData.append('student_id', this.studentId);
 
             const response = await fetch(`${this.apiBase}/detect-emotion`, {
                 method: 'POST',
@@ -0,0 +1,5 @@
+"""Production entrypoint: gunicorn -k geventwebsocket.gunicorn.workers.GeventWebSocketWorker wsgi:application"""
+from app import app, start_services
+
+start_services()
+application = app